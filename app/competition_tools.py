@@ -1,16 +1,22 @@
 import datetime
+import decimal
+import mmap
+import struct
 import sys
+import tempfile
 import threading
+import zlib
 
 import pandas as pd
 import os
 from enum import Enum
-from evaluation_functions import evaluator
+from evaluation_functions import evaluator, greater_is_better
 from sqlalchemy import inspect, func
+from sqlalchemy.exc import IntegrityError
 
 import numpy as np
 
-from models import Submission, Evaluation
+from models import Submission, Evaluation, LeaderboardHistory
 
 ALLOWED_EXTENSIONS = {'.csv'}
 
@@ -21,11 +27,42 @@ PUBLIC = "Public"
 HEADER = [INDEX, TARGET]
 SOLUTION_HEADER = [INDEX, TARGET, PUBLIC]
 
+# Binary solution artifact: a fixed header followed by the sorted Ids, the targets and the public mask,
+# each array starting on an ALIGNMENT boundary so that it can be viewed in place from a read-only mmap.
+# header: magic, version, ids/target dtypes, rows, ids/targets/public offsets, source crc32, payload crc32
+# Ids are stored as int64 or fixed-width unicode, targets as int64, float64 or fixed-width unicode (class labels).
+ARTIFACT_MAGIC = b"DSLESOL\x00"
+ARTIFACT_VERSION = 2
+ARTIFACT_ALIGNMENT = 64
+ARTIFACT_HEADER_FORMAT = "<8sI8s8sQQQQII"
+ARTIFACT_HEADER_SIZE = struct.calcsize(ARTIFACT_HEADER_FORMAT)
+ARTIFACT_IDS_KINDS = "iU"
+ARTIFACT_TARGET_KINDS = "ifU"
+ARTIFACT_PUBLIC_DTYPE = np.dtype(np.bool_)
+
+# Similarity report: submissions per tile side and 64-bit words per chunk compared at once
+SIMILARITY_SUBMISSIONS_BLOCK = 64
+SIMILARITY_WORDS_CHUNK = 512
+
 # function that maps db-stored score to printable value
 # TODO: move somewhere appropriate
 score_mapper = lambda score: f"{score :.3f}"
 
 
+def is_better(score, best):
+    return score > best if greater_is_better else score < best
+
+
+def stored_score(score):
+    # db.Numeric scores are read back as Decimal rounded to 10 places: compare scores in that representation
+    return decimal.Decimal(f"{score :.10f}")
+
+
+def best_first(column):
+    # order_by clause sorting `column` from the best to the worst score
+    return column.desc() if greater_is_better else column.asc()
+
+
 def get_user_submissions_number(user_id, db):
     submission_count = db.session \
         .query(func.count(Evaluation.submission_id)) \
@@ -34,7 +71,420 @@ def get_user_submissions_number(user_id, db):
     return submission_count
 
 
-def check_solution_file(solution_file):
+# attempts to record a leaderboard change when a concurrent evaluation of the same user wins the race
+LEADERBOARD_CHANGE_RETRIES = 3
+
+
+def _add_leaderboard_change(db, evaluation, timestamp=None):
+    user_id = evaluation.submission.user_id
+    best = db.session \
+        .query(LeaderboardHistory) \
+        .filter(LeaderboardHistory.user_id == user_id, LeaderboardHistory.superseded.is_(False)) \
+        .first()
+
+    if best is None or is_better(stored_score(evaluation.evaluation_public), stored_score(best.score)):
+        if best is not None:
+            best.superseded = True
+            # release the current row of the user before adding the new one
+            db.session.flush()
+        db.session.add(LeaderboardHistory(user_id=user_id,
+                                          submission_id=evaluation.submission.id,
+                                          score=evaluation.evaluation_public,
+                                          timestamp=timestamp or datetime.datetime.utcnow()))
+
+
+def record_leaderboard_change(db, evaluation):
+    """Append a leaderboard history row if `evaluation` improves its user's best public score.
+
+    The row is added to the current session: it is committed together with the evaluation.
+    """
+    # flush the evaluation first, so that the savepoint is taken inside the evaluation transaction
+    db.session.flush()
+    for attempt in range(LEADERBOARD_CHANGE_RETRIES):
+        try:
+            with db.session.begin_nested():
+                _add_leaderboard_change(db, evaluation)
+            return
+        except IntegrityError:
+            # another evaluation of the user has been committed meanwhile (one current row per user):
+            # compare with its row again
+            if attempt == LEADERBOARD_CHANGE_RETRIES - 1:
+                raise
+
+
+def rebuild_leaderboard_history(db):
+    """Fill the leaderboard history from the stored evaluations (e.g. for databases created before it existed).
+
+    Every worker process runs this at startup: the unique submission_id makes concurrent rebuilds fail
+    on commit, and only the first one is kept.
+    """
+    if db.session.query(LeaderboardHistory.id).first() is not None:
+        return
+
+    evaluations = db.session \
+        .query(Evaluation) \
+        .join(Submission) \
+        .order_by(Evaluation.timestamp.asc()) \
+        .all()
+    if not evaluations:
+        return
+
+    print(f"Rebuilding leaderboard history from {len(evaluations)} evaluations...")
+
+    try:
+        for evaluation in evaluations:
+            _add_leaderboard_change(db, evaluation, timestamp=evaluation.timestamp)
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        print("Leaderboard history already rebuilt by another process.")
+
+
+def get_leaderboard(db, as_of=None):
+    """Return the (user_id, score) leaderboard, best first, as it was at `as_of` (now if None)."""
+    if as_of is None:
+        participants = db.session \
+            .query(LeaderboardHistory.user_id, LeaderboardHistory.score) \
+            .filter(LeaderboardHistory.superseded.is_(False)) \
+            .order_by(best_first(LeaderboardHistory.score), LeaderboardHistory.timestamp.asc()) \
+            .all()
+        return participants
+
+    latest = db.session \
+        .query(func.max(LeaderboardHistory.id).label("id")) \
+        .filter(LeaderboardHistory.timestamp <= as_of) \
+        .group_by(LeaderboardHistory.user_id) \
+        .subquery()
+
+    participants = db.session \
+        .query(LeaderboardHistory.user_id, LeaderboardHistory.score) \
+        .join(latest, LeaderboardHistory.id == latest.c.id) \
+        .order_by(best_first(LeaderboardHistory.score), LeaderboardHistory.timestamp.asc()) \
+        .all()
+    return participants
+
+
+def get_user_progression(db, user_id):
+    """Return the (timestamp, score) steps of the best public score of `user_id`."""
+    progression = db.session \
+        .query(LeaderboardHistory.timestamp, LeaderboardHistory.score) \
+        .filter(LeaderboardHistory.user_id == user_id) \
+        .order_by(LeaderboardHistory.id.asc()) \
+        .all()
+    return progression
+
+
+def get_similarity_submissions(db, best_only=True):
+    """Return the (submission_id, user_id, filename) of the evaluated submissions to compare.
+
+    With `best_only`, only the submission holding the current best public score of each user is kept.
+    """
+    if best_only:
+        submissions = db.session \
+            .query(Submission.id, Submission.user_id, Submission.filename) \
+            .join(LeaderboardHistory, LeaderboardHistory.submission_id == Submission.id) \
+            .filter(LeaderboardHistory.superseded.is_(False)) \
+            .order_by(Submission.user_id.desc()) \
+            .all()
+    else:
+        submissions = db.session \
+            .query(Submission.id, Submission.user_id, Submission.filename) \
+            .join(Evaluation) \
+            .order_by(Submission.user_id.desc(), Submission.timestamp.desc()) \
+            .all()
+    return submissions
+
+
+def _popcount64(words):
+    # SWAR popcount of every uint64 word
+    words = words - ((words >> np.uint64(1)) & np.uint64(0x5555555555555555))
+    words = (words & np.uint64(0x3333333333333333)) + ((words >> np.uint64(2)) & np.uint64(0x3333333333333333))
+    words = (words + (words >> np.uint64(4))) & np.uint64(0x0f0f0f0f0f0f0f0f)
+    return (words * np.uint64(0x0101010101010101)) >> np.uint64(56)
+
+
+def _pack_errors(submission_file, solution):
+    df_pred = pd.read_csv(submission_file, index_col=INDEX)
+    try:
+        y_pred = sorted_predictions(df_pred, solution)
+    except Exception as ex:
+        raise Exception(f"Submission file '{submission_file}' does not match the solution - {ex}")
+
+    errors = np.packbits(y_pred != solution.targets)
+    # pad to whole 64-bit words, padding bits are never errors
+    words = np.zeros((len(errors) + 7) // 8 * 8, dtype=np.uint8)
+    words[:len(errors)] = errors
+    return words.view(np.uint64)
+
+
+def _cached_errors(submission_file, solution, cache_folder):
+    # Packed error vectors only depend on the submission file and on the solution file they are compared with.
+    # Stored submission file names are unique across competitions, unlike the ids of the current database.
+    stat = os.stat(submission_file)
+    cache_file = os.path.join(cache_folder, f"{os.path.basename(submission_file)}_{stat.st_size}_{stat.st_mtime_ns}"
+                                            f"_{solution.source_crc32:08x}.npy")
+    if os.path.isfile(cache_file):
+        try:
+            words = np.load(cache_file)
+            if words.shape == ((solution.n_rows + 63) // 64,):
+                return words
+        except Exception:
+            pass
+
+    words = _pack_errors(submission_file, solution)
+
+    # write to a private file and rename it, so concurrent reports never read a partial vector
+    tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+    with open(tmp_file, "wb") as f:
+        np.save(f, words)
+    os.replace(tmp_file, cache_file)
+    return words
+
+
+def _top_pairs(pairs, top_pairs):
+    # keep the `top_pairs` pairs with the highest error Jaccard index
+    if len(pairs["error_jaccard"]) <= top_pairs:
+        return pairs
+    top = np.argpartition(-pairs["error_jaccard"], top_pairs - 1)[:top_pairs]
+    return {column: values[top] for column, values in pairs.items()}
+
+
+def similarity_report(submissions, solution_artifact, cache_folder, top_pairs=100):
+    """Compare the errors of every pair of submissions of different users.
+
+    The errors of each submission against the solution are packed as bit vectors in a disk-backed
+    matrix. The pairwise counts are computed with a popcount over tiles of submissions and chunks of
+    words, and each tile is reduced right away into the running `top_pairs` most similar pairs, so
+    memory stays bounded by a tile. Returns those pairs, sorted by the Jaccard index of their errors.
+
+    The packed vectors are cached in `cache_folder`, so each submission file is parsed only once.
+    """
+    if top_pairs < 1:
+        raise Exception(f"The similarity report should keep at least 1 pair, not {top_pairs}.")
+
+    columns = ["submission_a", "user_a", "submission_b", "user_b",
+               "errors_a", "errors_b", "both_wrong", "agreement", "error_jaccard"]
+    solution = load_solution_artifact(solution_artifact)
+    n_words = max(1, (solution.n_rows + 63) // 64)
+    os.makedirs(cache_folder, exist_ok=True)
+
+    with tempfile.TemporaryFile(dir=cache_folder) as errors_file:
+        errors = np.memmap(errors_file, dtype=np.uint64, mode="w+", shape=(max(1, len(submissions)), n_words))
+
+        packed_submissions = []
+        for submission in submissions:
+            try:
+                errors[len(packed_submissions)] = _cached_errors(submission[2], solution, cache_folder)
+                packed_submissions.append(submission)
+            except Exception as ex:
+                print(f"Skipping submission {submission[0]} in the similarity report - {ex}")
+
+        n_submissions = len(packed_submissions)
+        if n_submissions < 2:
+            return pd.DataFrame(columns=columns)
+
+        submission_ids = np.array([submission[0] for submission in packed_submissions])
+        user_ids = np.array([submission[1] for submission in packed_submissions], dtype=object)
+        user_codes = pd.factorize(user_ids)[0]
+        n_errors = np.concatenate([_popcount64(errors[i:i + SIMILARITY_SUBMISSIONS_BLOCK]).sum(axis=1)
+                                   for i in range(0, n_submissions, SIMILARITY_SUBMISSIONS_BLOCK)]).astype(np.int64)
+
+        pairs = {"a": np.zeros(0, dtype=np.int64), "b": np.zeros(0, dtype=np.int64),
+                 "both_wrong": np.zeros(0, dtype=np.int64), "different": np.zeros(0, dtype=np.int64),
+                 "error_jaccard": np.zeros(0, dtype=np.float64)}
+
+        for i in range(0, n_submissions, SIMILARITY_SUBMISSIONS_BLOCK):
+            block_i = errors[i:min(i + SIMILARITY_SUBMISSIONS_BLOCK, n_submissions)]
+            for j in range(i, n_submissions, SIMILARITY_SUBMISSIONS_BLOCK):
+                block_j = errors[j:min(j + SIMILARITY_SUBMISSIONS_BLOCK, n_submissions)]
+
+                both_wrong = np.zeros((len(block_i), len(block_j)), dtype=np.int64)
+                different = np.zeros((len(block_i), len(block_j)), dtype=np.int64)
+                for w in range(0, n_words, SIMILARITY_WORDS_CHUNK):
+                    chunk_i = block_i[:, None, w:w + SIMILARITY_WORDS_CHUNK]
+                    chunk_j = block_j[None, :, w:w + SIMILARITY_WORDS_CHUNK]
+                    both_wrong += _popcount64(chunk_i & chunk_j).sum(axis=2).astype(np.int64)
+                    different += _popcount64(chunk_i ^ chunk_j).sum(axis=2).astype(np.int64)
+
+                # upper triangle only, without pairs of submissions of the same user
+                a, b = np.meshgrid(np.arange(i, i + len(block_i)), np.arange(j, j + len(block_j)), indexing="ij")
+                keep = (a < b) & (user_codes[a] != user_codes[b])
+                a, b, both_wrong, different = a[keep], b[keep], both_wrong[keep], different[keep]
+
+                error_union = n_errors[a] + n_errors[b] - both_wrong
+                error_jaccard = np.divide(both_wrong, error_union,
+                                          out=np.zeros(len(a), dtype=np.float64), where=error_union > 0)
+
+                tile = {"a": a, "b": b, "both_wrong": both_wrong, "different": different,
+                        "error_jaccard": error_jaccard}
+                pairs = _top_pairs({column: np.concatenate([pairs[column], tile[column]]) for column in pairs},
+                                   top_pairs)
+
+        del errors
+
+    order = np.lexsort((pairs["b"], pairs["a"], -pairs["error_jaccard"]))
+    a, b = pairs["a"][order], pairs["b"][order]
+
+    return pd.DataFrame({
+        "submission_a": submission_ids[a],
+        "user_a": user_ids[a],
+        "submission_b": submission_ids[b],
+        "user_b": user_ids[b],
+        "errors_a": n_errors[a],
+        "errors_b": n_errors[b],
+        "both_wrong": pairs["both_wrong"][order],
+        "agreement": 1 - pairs["different"][order] / solution.n_rows,
+        "error_jaccard": pairs["error_jaccard"][order],
+    }, columns=columns)
+
+
+def _align(offset):
+    return (offset + ARTIFACT_ALIGNMENT - 1) // ARTIFACT_ALIGNMENT * ARTIFACT_ALIGNMENT
+
+
+def _artifact_dtype(values):
+    if pd.api.types.is_integer_dtype(values) or pd.api.types.is_bool_dtype(values):
+        return np.dtype("<i8")
+    if pd.api.types.is_float_dtype(values):
+        return np.dtype("<f8")
+    # anything else (e.g. text Ids or class labels) is compared as text
+    return np.asarray(values).astype(str).dtype.newbyteorder("<")
+
+
+def as_artifact_values(values, dtype):
+    """Convert submitted Ids or predictions so that they can be compared with the artifact arrays of `dtype`."""
+    values = np.asarray(values)
+    if dtype.kind == "U" and values.dtype.kind != "U":
+        return values.astype(str)
+    return values
+
+
+def sorted_predictions(df_pred, solution):
+    """Return the predictions of `df_pred` in the order of the solution Ids, raising if the Ids do not match."""
+    ids = as_artifact_values(df_pred.index.values, solution.ids.dtype)
+    order = np.argsort(ids, kind="stable")
+    if len(ids) != solution.n_rows or not (ids[order] == solution.ids).all():
+        raise Exception("Indices do not match!")
+    return as_artifact_values(df_pred[TARGET].values[order], solution.targets.dtype)
+
+
+def _file_crc32(file_path):
+    crc = 0
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            crc = zlib.crc32(chunk, crc)
+    return crc
+
+
+class SolutionArtifact:
+    """Read-only view of a compiled solution file.
+
+    The arrays are backed by a shared mmap of the artifact, so every process
+    mapping the same file shares its pages through the OS cache.
+    """
+    def __init__(self, artifact_file):
+        self.artifact_file = artifact_file
+        with open(artifact_file, "rb") as f:
+            self.stat = os.fstat(f.fileno())
+            if self.stat.st_size < ARTIFACT_HEADER_SIZE:
+                raise Exception(f"Solution artifact '{artifact_file}' is truncated.")
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, ids_dtype, target_dtype, self.n_rows, self.ids_offset, targets_offset, public_offset, \
+            self.source_crc32, self.payload_crc32 = struct.unpack_from(ARTIFACT_HEADER_FORMAT, self._mm, 0)
+
+        try:
+            if magic != ARTIFACT_MAGIC or version != ARTIFACT_VERSION:
+                raise ValueError()
+            ids_dtype = np.dtype(ids_dtype.rstrip(b"\x00").decode())
+            target_dtype = np.dtype(target_dtype.rstrip(b"\x00").decode())
+            if ids_dtype.kind not in ARTIFACT_IDS_KINDS or target_dtype.kind not in ARTIFACT_TARGET_KINDS:
+                raise ValueError()
+        except (ValueError, TypeError, UnicodeDecodeError):
+            self._mm.close()
+            raise Exception(f"Solution artifact '{artifact_file}' has an unsupported format.")
+        if public_offset + self.n_rows * ARTIFACT_PUBLIC_DTYPE.itemsize > len(self._mm):
+            self._mm.close()
+            raise Exception(f"Solution artifact '{artifact_file}' is truncated.")
+
+        self.ids = np.frombuffer(self._mm, dtype=ids_dtype, count=self.n_rows, offset=self.ids_offset)
+        self.targets = np.frombuffer(self._mm, dtype=target_dtype, count=self.n_rows, offset=targets_offset)
+        self.public = np.frombuffer(self._mm, dtype=ARTIFACT_PUBLIC_DTYPE, count=self.n_rows, offset=public_offset)
+
+    def is_valid(self):
+        with memoryview(self._mm) as payload:
+            return zlib.crc32(payload[self.ids_offset:]) == self.payload_crc32
+
+
+# artifacts already mapped by this process, keyed by path
+_solution_artifacts = {}
+
+
+def load_solution_artifact(artifact_file):
+    artifact = _solution_artifacts.get(artifact_file)
+    if artifact is not None:
+        stat = os.stat(artifact_file)
+        # the artifact has been replaced by a new compilation: map the new file
+        if (stat.st_ino, stat.st_mtime_ns) == (artifact.stat.st_ino, artifact.stat.st_mtime_ns):
+            return artifact
+    artifact = SolutionArtifact(artifact_file)
+    _solution_artifacts[artifact_file] = artifact
+    return artifact
+
+
+def compile_solution_artifact(solution_file, artifact_file):
+    source_crc32 = _file_crc32(solution_file)
+
+    # Skip the compilation when an artifact for this very solution file already exists:
+    # rewriting it would give each worker process its own copy of the pages.
+    if os.path.isfile(artifact_file):
+        try:
+            artifact = load_solution_artifact(artifact_file)
+            if artifact.source_crc32 == source_crc32 and artifact.is_valid():
+                return artifact_file
+        except Exception:
+            pass
+
+    print(f"Compiling solution file '{solution_file}' to '{artifact_file}'...")
+    solution_df = pd.read_csv(solution_file, index_col=INDEX)
+
+    # float Ids are stored as text, as they are matched exactly
+    ids_dtype = _artifact_dtype(solution_df.index)
+    if ids_dtype.kind == "f":
+        ids_dtype = _artifact_dtype(solution_df.index.astype(str))
+    target_dtype = _artifact_dtype(solution_df[TARGET])
+
+    n_rows = len(solution_df.index)
+    ids = as_artifact_values(solution_df.index.values, ids_dtype).astype(ids_dtype)
+    order = np.argsort(ids, kind="stable")
+    ids = ids[order]
+    targets = as_artifact_values(solution_df[TARGET].values, target_dtype).astype(target_dtype)[order]
+    public = (solution_df[PUBLIC].values == 1).astype(ARTIFACT_PUBLIC_DTYPE)[order]
+
+    ids_offset = _align(ARTIFACT_HEADER_SIZE)
+    targets_offset = _align(ids_offset + ids.nbytes)
+    public_offset = _align(targets_offset + targets.nbytes)
+
+    payload = bytearray(public_offset + public.nbytes - ids_offset)
+    for offset, values in [(ids_offset, ids), (targets_offset, targets), (public_offset, public)]:
+        payload[offset - ids_offset:offset - ids_offset + values.nbytes] = values.tobytes()
+
+    header = bytearray(ids_offset)
+    struct.pack_into(ARTIFACT_HEADER_FORMAT, header, 0, ARTIFACT_MAGIC, ARTIFACT_VERSION,
+                     ids_dtype.str.encode(), target_dtype.str.encode(), n_rows,
+                     ids_offset, targets_offset, public_offset, source_crc32, zlib.crc32(payload))
+
+    # write to a private file and rename it, so other processes never map a partial artifact
+    tmp_file = f"{artifact_file}.{os.getpid()}.tmp"
+    with open(tmp_file, "wb") as f:
+        f.write(header)
+        f.write(payload)
+    os.replace(tmp_file, artifact_file)
+
+    return artifact_file
+
+
+def check_solution_file(solution_file, artifact_file=None):
     print(f"Checking solution file '{solution_file}'...")
     try:
         solution_df = pd.read_csv(solution_file, index_col=INDEX)
@@ -52,6 +502,12 @@ def check_solution_file(solution_file):
                 (not all([(v in [0, 1]) for v in solution_df[PUBLIC].unique()])):
             raise Exception(f"Public column should contains only 0 and 1 where:\n - 1 means public\n - 0 means private")
 
+        if artifact_file is not None:
+            compile_solution_artifact(solution_file, artifact_file)
+            artifact = load_solution_artifact(artifact_file)
+            if (not artifact.is_valid()) or (artifact.n_rows != len(solution_df.index)):
+                raise Exception(f"Solution artifact '{artifact_file}' is corrupted. Delete it and restart.")
+
     except Exception as ex:
         raise Exception(f"Test solution error - File: {solution_file} - {ex}")
 
@@ -59,11 +515,11 @@ def check_solution_file(solution_file):
     return True
 
 
-def check_file(file, test_file):
+def check_file(file, solution_artifact):
     try:
-        test_df = pd.read_csv(test_file, index_col=INDEX)
+        solution = load_solution_artifact(solution_artifact)
     except Exception as ex:
-        raise Exception(f"Test solution error - File: {test_file} - {ex}")
+        raise Exception(f"Test solution error - File: {solution_artifact} - {ex}")
 
     submitted_df = pd.read_csv(file.stream, index_col=INDEX)
     submitted_columns = list(submitted_df.columns) + [INDEX] # "INDEX" is not included in .columns
@@ -76,33 +532,30 @@ def check_file(file, test_file):
         raise Exception(f"Too many columns - Expecting columns {HEADER} in submitted solution.")
 
     # check file len
-    if len(submitted_df.index) != len(test_df.index):
-        raise Exception(f"Submitted solution length does not match the dataset length. Submitted solution has {len(submitted_df.index)} rows while Dataset has {len(test_df.index)} rows.")
+    if len(submitted_df.index) != solution.n_rows:
+        raise Exception(f"Submitted solution length does not match the dataset length. Submitted solution has {len(submitted_df.index)} rows while Dataset has {solution.n_rows} rows.")
 
     # TODO: check file size
 
     # check indices
-    if set(submitted_df.index) != set(test_df.index):
-        raise Exception("Indices do not match!")
+    sorted_predictions(submitted_df, solution)
 
     return True
 
-def eval_public_private(submission, solution):
+def eval_public_private(submission, solution_artifact):
     try:
-        df_pred = pd.read_csv(submission, index_col=INDEX).sort_index()
-        df_true = pd.read_csv(solution, index_col=INDEX).sort_index()
-        assert len(df_pred) == len(df_true) # already checked, should be true!x
-        assert (df_pred.index == df_true.index).all() # already checked, should be true!
+        solution = load_solution_artifact(solution_artifact)
+        y_pred = sorted_predictions(pd.read_csv(submission, index_col=INDEX), solution) # already checked, should not raise!
     except Exception:
         # We shuld never fail here -- the file has already been validated!
         raise Exception("Unexpected error! Please contact an administrator")
 
-    public_mask = df_true[PUBLIC] == 1
-    y_pred_public = df_pred[public_mask][TARGET].values
-    y_true_public = df_true[public_mask][TARGET].values
+    public_mask = solution.public
+    y_pred_public = y_pred[public_mask]
+    y_true_public = solution.targets[public_mask]
 
-    y_pred_private = df_pred[~public_mask][TARGET].values
-    y_true_private = df_true[~public_mask][TARGET].values
+    y_pred_private = y_pred[~public_mask]
+    y_true_private = solution.targets[~public_mask]
 
     public_score = evaluator(y_true_public, y_pred_public)
     private_score = evaluator(y_true_private, y_pred_private)
@@ -123,7 +576,8 @@ def get_timestamp():
     return timestamp_id
 
 
-def schedule_db_dump(sched_time, db, stage_name, dump_out):
+def schedule_db_dump(sched_time, db, stage_name, dump_out, solution_artifact=None, similarity_cache=None,
+                     top_pairs=100):
 
     if not os.path.isdir(dump_out):
         print(f"Dump folder '{dump_out}' not exist! Create it!")
@@ -134,6 +588,9 @@ def schedule_db_dump(sched_time, db, stage_name, dump_out):
     parsed_sched_time = datetime.datetime.strptime(sched_time, "%Y/%m/%d %H:%M:%S")
     delay = (parsed_sched_time - now).total_seconds()
 
+    if similarity_cache is None:
+        similarity_cache = os.path.join(dump_out, "similarity_cache")
+
     def dumb_db_dump(db, stage_name, dump_out):
         dump_time = datetime.datetime.utcnow().strftime("%Y%m%d%H%M%S")
         inspector = inspect(db.engine)
@@ -146,6 +603,17 @@ def schedule_db_dump(sched_time, db, stage_name, dump_out):
 
             print(f"Dumping {t_name} to {dest_path}")
             t_df.to_csv(dest_path, index=False)
+
+        if solution_artifact is not None:
+            dest_path = os.path.join(dump_out, f"similarity_{stage_name}_{dump_time}_report.csv")
+
+            print("Computing submission similarity report...")
+            report_df = similarity_report(get_similarity_submissions(db), solution_artifact, similarity_cache,
+                                          top_pairs=top_pairs)
+
+            print(f"Dumping similarity report to {dest_path}")
+            report_df.to_csv(dest_path, index=False)
+
     if delay > 0:
         threading\
             .Timer(delay, dumb_db_dump, kwargs={"db": db, "stage_name": stage_name, "dump_out": dump_out})\
@@ -14,8 +14,11 @@ class CompetitionConfig:
     DUMP_FOLDER = './dumps'  # Where to store DB dumps with scores
 
     TEST_FILE_PATH = './static/test_solution/test_solution.csv'  # './static/test_solution/eval_solution.csv'
+    SOLUTION_ARTIFACT_PATH = './test_solution.bin'  # Compiled TEST_FILE_PATH, mmap-ed by every worker
     MAX_FILE_SIZE = 32 * 1024 * 1024  # limit upload file size to 32MB
     API_FILE = 'mappings.dummy.json'  # API mappings
     DB_FILE = 'sqlite:///test.db'
     TIME_BETWEEN_SUBMISSIONS = 5 * 60  # 5 minutes between submissions
     MAX_NUMBER_SUBMISSIONS = 100
+    SIMILARITY_TOP_PAIRS = 100  # Most similar submission pairs kept in the similarity report
+    SIMILARITY_CACHE_FOLDER = './uploads/similarity_cache'  # Where to cache the packed errors of the submissions
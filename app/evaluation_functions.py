@@ -1,3 +1,4 @@
 from sklearn.metrics import accuracy_score
 
-evaluator = accuracy_score
\ No newline at end of file
+evaluator = accuracy_score
+greater_is_better = True  # False for errors, e.g. mean_squared_error
\ No newline at end of file
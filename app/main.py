@@ -1,7 +1,7 @@
 import traceback
 
 from flask import Flask, session, redirect, url_for
-from flask import render_template, request
+from flask import render_template, request, jsonify
 from flask_cors import CORS
 import competition_tools
 import os
@@ -20,16 +20,27 @@ CORS(app)
 
 stage_handler = StageHandler(app.config['OPEN_TIME'], app.config['CLOSE_TIME'], app.config['TERMINATE_TIME'])
 api_auth = ApiAuth(app.config['API_FILE'])
+
+if app.config['SIMILARITY_TOP_PAIRS'] < 1:
+    raise RuntimeError('SIMILARITY_TOP_PAIRS should be at least 1!')
+
 app.config["SQLALCHEMY_DATABASE_URI"] = app.config['DB_FILE']
 db.init_app(app)
 db.app = app
 db.create_all()
+competition_tools.rebuild_leaderboard_history(db)
 
-competition_tools.check_solution_file(app.config['TEST_FILE_PATH'])
+competition_tools.check_solution_file(app.config['TEST_FILE_PATH'], app.config['SOLUTION_ARTIFACT_PATH'])
 
-competition_tools.schedule_db_dump(app.config['CLOSE_TIME'], db, stage_name="CLOSE", dump_out=app.config['DUMP_FOLDER'])
+competition_tools.schedule_db_dump(app.config['CLOSE_TIME'], db, stage_name="CLOSE", dump_out=app.config['DUMP_FOLDER'],
+                                    solution_artifact=app.config['SOLUTION_ARTIFACT_PATH'],
+                                    similarity_cache=app.config['SIMILARITY_CACHE_FOLDER'],
+                                    top_pairs=app.config['SIMILARITY_TOP_PAIRS'])
 
-competition_tools.schedule_db_dump(app.config['TERMINATE_TIME'], db, stage_name="TERMINATE", dump_out=app.config['DUMP_FOLDER'])
+competition_tools.schedule_db_dump(app.config['TERMINATE_TIME'], db, stage_name="TERMINATE", dump_out=app.config['DUMP_FOLDER'],
+                                    solution_artifact=app.config['SOLUTION_ARTIFACT_PATH'],
+                                    similarity_cache=app.config['SIMILARITY_CACHE_FOLDER'],
+                                    top_pairs=app.config['SIMILARITY_TOP_PAIRS'])
 
 def get_user_id(api_key):
     if not api_auth.is_valid(api_key):
@@ -181,16 +192,10 @@ def leaderboard():
                 stage_handler.is_terminated():
             return render_template("over.html", name=app.config['NAME'])
         else: # Get the leaderboard
-            # TODO: here, we assume that a higher score is preferable.
-            # it might not always be like this (e.g. MSE)
-            # For those cases, func.min should be used: make this parameter
-            # configurable from config file
-            participants = db.session \
-                .query(Submission.user_id, func.max(Evaluation.evaluation_public)) \
-                .join(Submission) \
-                .group_by(Submission.user_id) \
-                .order_by(Evaluation.evaluation_public.desc()) \
-                .all()
+            as_of = request.args.get("as_of", None)
+            if as_of:
+                as_of = datetime.strptime(as_of, "%Y/%m/%d %H:%M:%S")
+            participants = competition_tools.get_leaderboard(db, as_of=as_of)
             score = request.args.get("score")
             highlight_user_id = request.args.get("highlight")
             participants = [(user_id, competition_tools.score_mapper(score)) for user_id, score in participants]
@@ -209,13 +214,78 @@ def leaderboard():
                                    can_submit=True,
                                    close_time=stage_handler.close_time,
                                    is_closed=stage_handler.is_closed(),
-                                   left=left)
+                                   left=left,
+                                   as_of=as_of,
+                                   admin_api_key=api_key if user_id == app.config['ADMIN_USER_ID'] else None)
 
     except Exception as ex:
         traceback.print_stack()
         traceback.print_exc()
         return redirect(url_for('error', error_message=ex))
 
+@app.route('/leaderboard.json', methods=["GET"])
+def leaderboard_json():
+    try:
+        user_id = None
+        api_key = request.args.get("api_key", None)
+        if api_key is not None:
+            user_id = get_user_id(api_key)
+
+        if ((user_id is None) or (user_id not in [app.config['ADMIN_USER_ID']])) and \
+                (stage_handler.is_ready() or stage_handler.is_terminated()):
+            return jsonify(error="The leaderboard is not available."), 403
+
+        as_of = request.args.get("as_of", None)
+        if as_of:
+            as_of = datetime.strptime(as_of, "%Y/%m/%d %H:%M:%S")
+        participants = competition_tools.get_leaderboard(db, as_of=as_of)
+
+        return jsonify(as_of=as_of.strftime("%Y/%m/%d %H:%M:%S") if as_of else None,
+                       participants=[{"rank": rank, "user_id": p_user_id, "score": float(score)}
+                                     for rank, (p_user_id, score) in enumerate(participants, start=1)])
+
+    except Exception as ex:
+        traceback.print_exc()
+        return jsonify(error=str(ex)), 400
+
+#####################
+# score progression
+#####################
+
+def get_progression(api_key):
+    user_id = get_user_id(api_key)
+    # admins can check the progression of any user
+    if user_id == app.config['ADMIN_USER_ID']:
+        user_id = request.args.get("user", user_id)
+    return user_id, competition_tools.get_user_progression(db, user_id)
+
+
+@app.route('/progression', methods=["GET"])
+def progression():
+    try:
+        user_id, user_progression = get_progression(request.args.get("api_key", None))
+        app.logger.info(f"Received request to progression page for user_id '{user_id}'.")
+        user_progression = [(timestamp, competition_tools.score_mapper(score)) for timestamp, score in user_progression]
+        return render_template("progression.html", user_id=user_id, progression=user_progression)
+
+    except Exception as ex:
+        traceback.print_stack()
+        traceback.print_exc()
+        return redirect(url_for('error', error_message=ex))
+
+
+@app.route('/progression.json', methods=["GET"])
+def progression_json():
+    try:
+        user_id, user_progression = get_progression(request.args.get("api_key", None))
+        return jsonify(user_id=user_id,
+                       progression=[{"timestamp": timestamp.strftime("%Y/%m/%d %H:%M:%S"), "score": float(score)}
+                                    for timestamp, score in user_progression])
+
+    except Exception as ex:
+        traceback.print_exc()
+        return jsonify(error=str(ex)), 400
+
 ###################
 # final leaderboard
 ###################
@@ -277,6 +347,47 @@ def fleaderboard():
 
     return render_template("leaderboard.html", participants=participants, can_submit=False)
 
+####################
+# similarity report
+####################
+
+@app.route('/similarity', methods=["GET"])
+def similarity():
+    try:
+        user_id = None
+        api_key = request.args.get("api_key", None)
+        if api_key is not None:
+            user_id = get_user_id(api_key)
+            app.logger.info(f"Received request to similarity report page by user_id '{user_id}'.")
+
+    except Exception as ex:
+        traceback.print_stack()
+        traceback.print_exc()
+        return redirect(url_for('error', error_message=ex))
+
+    if ((user_id is None) or (user_id not in [app.config['ADMIN_USER_ID']])):
+        return redirect(url_for("leaderboard"))
+
+    try:
+        # compare the best submission of each user, or all of them with ?all=1
+        best_only = request.args.get("all", "0") != "1"
+        submissions = competition_tools.get_similarity_submissions(db, best_only=best_only)
+        report_df = competition_tools.similarity_report(submissions,
+                                                        app.config['SOLUTION_ARTIFACT_PATH'],
+                                                        app.config['SIMILARITY_CACHE_FOLDER'],
+                                                        top_pairs=app.config['SIMILARITY_TOP_PAIRS'])
+        pairs = [(user_a, submission_a, user_b, submission_b, f"{agreement :.3f}", both_wrong, f"{error_jaccard :.3f}")
+                 for user_a, submission_a, user_b, submission_b, agreement, both_wrong, error_jaccard in
+                 report_df[["user_a", "submission_a", "user_b", "submission_b",
+                            "agreement", "both_wrong", "error_jaccard"]].itertuples(index=False)]
+
+        return render_template("similarity.html", pairs=pairs, best_only=best_only, api_key=api_key)
+
+    except Exception as ex:
+        traceback.print_stack()
+        traceback.print_exc()
+        return redirect(url_for('error', error_message=ex))
+
 ################
 # Show evaluate score
 ################
@@ -303,7 +414,7 @@ def evaluate():
 
             submission_id = request.args.get("submission_id")
             submission = Submission.query.filter_by(id=submission_id, user_id=user_id).first()
-            public_score, private_score = eval_public_private(submission.filename, app.config['TEST_FILE_PATH'])
+            public_score, private_score = eval_public_private(submission.filename, app.config['SOLUTION_ARTIFACT_PATH'])
             if not submission:
                 # not found!
                 raise Exception("Submission not found!")
@@ -314,6 +425,7 @@ def evaluate():
             else:
                 evaluation = Evaluation(submission=submission, evaluation_public=public_score, evaluation_private=private_score)
                 db.session.add(evaluation)
+                competition_tools.record_leaderboard_change(db, evaluation)
                 db.session.commit()
 
                 if user_id == app.config['BASELINE_USER_ID']:
@@ -388,7 +500,7 @@ def upload():
                     raise Exception(error_message)
 
                 if competition_tools.allowed_file(file.filename) and \
-                        competition_tools.check_file(file, app.config['TEST_FILE_PATH']):
+                        competition_tools.check_file(file, app.config['SOLUTION_ARTIFACT_PATH']):
 
                     timestamp = competition_tools.get_timestamp()
                     new_file_name = f"{timestamp}_{user_id}.csv"
@@ -18,4 +18,23 @@ class Evaluation(db.Model):
     evaluation_public = db.Column(db.Numeric, nullable=False)
     evaluation_private = db.Column(db.Numeric, nullable=False)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
-    private_check = db.Column(db.Boolean, default=False, nullable=False)
\ No newline at end of file
+    private_check = db.Column(db.Boolean, default=False, nullable=False)
+
+class LeaderboardHistory(db.Model):
+    # a row is added every time an evaluation improves the best public score of a user, and the previous
+    # row of the user is flagged as superseded: rows are never deleted and at most one per user is current
+    __table_args__ = (db.Index("ix_leaderboard_history_user_timestamp", "user_id", "timestamp"),
+                      db.Index("ix_leaderboard_history_superseded_score", "superseded", "score"),
+                      db.Index("ux_leaderboard_history_current_user", "user_id", unique=True,
+                               sqlite_where=db.text("NOT superseded"),
+                               postgresql_where=db.text("NOT superseded")))
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.String(32), nullable=False)
+    submission_id = db.Column(db.Integer, db.ForeignKey("submission.id"), nullable=False, unique=True)
+    score = db.Column(db.Numeric, nullable=False)
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+    superseded = db.Column(db.Boolean, default=False, nullable=False)
+
+    def __repr__(self):
+        return f"<LeaderboardHistory ({self.user_id}, {self.score}, {self.timestamp})>"